@@ -19,16 +19,24 @@ License: MIT
 
 import argparse
 import json
+import mmap
+import os
+import pickle
 import re
 import shutil
 import subprocess
 import sys
-from collections import defaultdict
+from collections import Counter, defaultdict, namedtuple
 from datetime import datetime
 from pathlib import Path
 
 import yaml
 
+try:
+    import orjson
+except ImportError:  # optional: faster registry parsing/writing
+    orjson = None
+
 # Default configuration
 DEFAULT_CONFIG = {
     "ha_config_path": "/srv/HA/ha-config",
@@ -74,6 +82,107 @@ DEFAULT_CONFIG = {
 }
 
 
+# Entity domains exposed to HomeKit, mapped to their mapping-file key
+HOMEKIT_DOMAINS = {"light": "lights", "switch": "switches"}
+
+# Entity registry fields this tool reads; everything else is dropped on load
+ENTITY_FIELDS = ("entity_id", "platform", "area_id", "device_id", "disabled_by", "name", "original_name")
+
+# Registry lookups shared by generate() and analyze(). filtered_entities holds
+# (entity_id, domain, area_id, area_name, name) for every enabled light or
+# switch that passes the filters, where name is the registry name (may be
+# None); excluded_count tallies rejects by platform.
+RegistryIndices = namedtuple("RegistryIndices", [
+    "area_map", "device_to_area", "area_floors", "floor_map",
+    "filtered_entities", "excluded_count",
+])
+
+# Registries the indices are built from, used to detect changes on disk
+INDEX_REGISTRIES = ("entity_registry", "device_registry", "area_registry", "floor_registry")
+
+# Registries cached on disk between runs. Never core.config_entries: it holds
+# integration credentials.
+CACHED_REGISTRIES = ("entity_registry", "device_registry", "area_registry")
+
+# Part of every cache key; change it (or ENTITY_FIELDS) to invalidate old caches
+CACHE_FORMAT = (1, ENTITY_FIELDS)
+
+
+def _read_json(path):
+    """Parse a JSON file, using orjson when available"""
+    if orjson is not None:
+        with open(path, "rb") as f:
+            try:
+                # Let orjson parse straight from the page cache, no read() copy
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (ValueError, OSError):  # empty file, or fs that can't be mapped
+                return orjson.loads(f.read())
+            try:
+                with memoryview(mm) as view:
+                    return orjson.loads(view)
+            finally:
+                mm.close()
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_json(path, data):
+    """Write data as 2-space indented JSON, using orjson when available.
+
+    The file is written to a temporary sibling and swapped in with os.replace,
+    so readers never see a partially written file. An existing file's mode and
+    ownership are carried over (apply runs under sudo, HA owns .storage).
+    """
+    path = Path(path)
+    tmp_path = path.with_name(path.name + ".tmp")
+
+    try:
+        if orjson is not None:
+            with open(tmp_path, "wb") as f:
+                # NON_STR_KEYS: YAML can yield int bridge names; json.dump stringifies them too
+                f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS))
+                f.flush()
+                os.fsync(f.fileno())
+        else:
+            with open(tmp_path, "w") as f:
+                json.dump(data, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+
+        try:
+            st = path.stat()
+        except FileNotFoundError:
+            pass
+        else:
+            os.chmod(tmp_path, st.st_mode & 0o7777)
+            try:
+                os.chown(tmp_path, st.st_uid, st.st_gid)
+            except (AttributeError, PermissionError):
+                pass  # Not supported, or not privileged to change ownership
+
+        os.replace(tmp_path, path)
+    except BaseException:
+        # Don't leave a half-written .tmp behind (e.g. in HA's .storage)
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def _trim_entities(entity_reg):
+    """Drop entity registry fields this tool never reads"""
+    entity_reg["data"]["entities"] = [
+        {k: e[k] for k in ENTITY_FIELDS if k in e} for e in entity_reg["data"]["entities"]
+    ]
+    return entity_reg
+
+
+def _display_name(entity_id, name):
+    """Registry name, or a title-cased object_id when the entity has none"""
+    return name or entity_id.split(".", 1)[1].replace("_", " ").title()
+
+
 class HomeKitBridgeManager:
     def __init__(self, config_path=None):
         self.config = self._load_config(config_path)
@@ -81,6 +190,29 @@ class HomeKitBridgeManager:
         self.storage_path = self.ha_path / ".storage"
         self.output_dir = Path(self.config["output_dir"])
 
+        # Pre-build filter lookups so per-entity checks avoid list scans
+        self._ignored_entities = frozenset(self.config.get("ignored_entities") or [])
+        self._excluded_integrations = frozenset(
+            sys.intern(p) if isinstance(p, str) else p
+            for p in self.config.get("excluded_integrations") or []
+        )
+
+        # Fuse exclusion patterns into one alternation so each entity needs a
+        # single regex search. Only done when no pattern has groups (group
+        # numbers would shift, names could clash) or global inline flags like
+        # (?i), which are only valid at the start of an expression.
+        patterns = self.config.get("excluded_patterns") or []
+        self._excluded_res = [re.compile(p) for p in patterns]
+        default_flags = re.compile("").flags
+        if len(patterns) > 1 and all(r.groups == 0 and r.flags == default_flags for r in self._excluded_res):
+            try:
+                self._excluded_res = [re.compile("|".join(f"(?:{p})" for p in patterns))]
+            except re.error:
+                pass  # Keep the per-pattern regexes
+
+        # (registry stamp, RegistryIndices) built lazily by the _indices property
+        self._indices_cache = None
+
     def _load_config(self, config_path):
         """Load configuration from YAML file or use defaults"""
         config = DEFAULT_CONFIG.copy()
@@ -93,125 +225,229 @@ class HomeKitBridgeManager:
 
         return config
 
-    def _load_registry(self, name):
-        """Load a registry file from .storage"""
+    def _load_registry(self, name, prepare=None):
+        """Load a registry file from .storage
+
+        prepare, if given, is applied to freshly parsed data before it is
+        cached, so cache hits return the already-prepared form.
+        """
         path = self.storage_path / f"core.{name}"
         if not path.exists():
             print(f"❌ Registry not found: {path}")
             sys.exit(1)
-        with open(path) as f:
-            return json.load(f)
+
+        if name not in CACHED_REGISTRIES:
+            return _read_json(path)
+
+        # Reuse the parsed registry from a previous run if the file is unchanged
+        st = path.stat()
+        cache_key = (CACHE_FORMAT, st.st_mtime_ns, st.st_size)
+        cache_file = self.output_dir / f".cache_{name}.pkl"
+        data = self._read_cache(cache_file, cache_key)
+        if data is not None:
+            return data
+
+        data = _read_json(path)
+        if prepare is not None:
+            data = prepare(data)
+        self._write_cache(cache_file, cache_key, data)
+        return data
+
+    def _read_cache(self, cache_file, cache_key):
+        """Return cached registry data if present, trusted and current, else None"""
+        try:
+            with open(cache_file, "rb") as f:
+                # Only unpickle files we own that nobody else can write
+                # (ownership/mode checks are POSIX-only; skipped elsewhere)
+                if hasattr(os, "getuid"):
+                    st = os.fstat(f.fileno())
+                    if st.st_uid != os.getuid() or st.st_mode & 0o022:
+                        return None
+                cached_key, data = pickle.load(f)
+        except (OSError, AttributeError, pickle.UnpicklingError, EOFError, ValueError, TypeError):
+            return None
+        return data if cached_key == cache_key else None
+
+    def _write_cache(self, cache_file, cache_key, data):
+        """Atomically write a private (0600) registry cache file, best-effort"""
+        tmp_path = cache_file.with_name(cache_file.name + ".tmp")
+        try:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with open(fd, "wb") as f:
+                if hasattr(os, "fchmod"):  # Not available on Windows before 3.13
+                    os.fchmod(f.fileno(), 0o600)
+                pickle.dump((cache_key, data), f, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_path, cache_file)
+        except (OSError, AttributeError):
+            # Cache is best-effort (e.g. read-only output dir)
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
 
     def _should_include_entity(self, entity_id, platform):
         """Check if entity should be included based on filters"""
         # Check explicit ignore list
-        if entity_id in self.config.get("ignored_entities", []):
+        if entity_id in self._ignored_entities:
             return False
 
         # Check integration exclusions
-        if platform in self.config.get("excluded_integrations", []):
+        if platform in self._excluded_integrations:
             return False
 
         # Check pattern exclusions
-        for pattern in self.config.get("excluded_patterns", []):
-            if re.search(pattern, entity_id):
+        for pattern in self._excluded_res:
+            if pattern.search(entity_id):
                 return False
 
         return True
 
-    def generate(self):
-        """Generate entity-to-bridge mapping"""
-        print("=" * 70)
-        print("Generating HomeKit Bridge Mapping")
-        print("=" * 70)
-
-        # Load registries
-        entity_reg = self._load_registry("entity_registry")
+    def _registry_stamp(self):
+        """(mtime, size) of each indexed registry, None for missing files"""
+        stamp = []
+        for name in INDEX_REGISTRIES:
+            path = self.storage_path / f"core.{name}"
+            try:
+                st = path.stat()
+            except OSError:
+                stamp.append(None)
+                continue
+            stamp.append((st.st_mtime_ns, st.st_size))
+        return tuple(stamp)
+
+    @property
+    def _indices(self):
+        """Shared registry indices, rebuilt only when a registry file changes"""
+        stamp = self._registry_stamp()
+        if self._indices_cache is None or self._indices_cache[0] != stamp:
+            self._indices_cache = (stamp, self._build_indices())
+        return self._indices_cache[1]
+
+    def _build_indices(self):
+        """Load registries once and pre-filter light/switch entities"""
+        # Keep only consumed entity fields so the cache and later passes stay small
+        entity_reg = self._load_registry("entity_registry", prepare=_trim_entities)
         device_reg = self._load_registry("device_registry")
         area_reg = self._load_registry("area_registry")
+        floor_reg_path = self.storage_path / "core.floor_registry"
 
         # Build lookups
-        area_map = {a["id"]: a["name"] for a in area_reg["data"]["areas"]}
-        device_to_area = {d["id"]: d.get("area_id") for d in device_reg["data"]["devices"]}
+        area_map = {sys.intern(a["id"]): a["name"] for a in area_reg["data"]["areas"]}
+        area_floors = {sys.intern(a["id"]): a.get("floor_id") for a in area_reg["data"]["areas"]}
+        device_to_area = {}
+        for device in device_reg["data"]["devices"]:
+            area_id = device.get("area_id")
+            device_to_area[device["id"]] = area_id and sys.intern(area_id)
 
-        # Build entity info
-        entity_names = {}
-        entity_platforms = {}
+        # Load floors if available
+        floor_map = {}
+        if floor_reg_path.exists():
+            floor_reg = _read_json(floor_reg_path)
+            floor_map = {f["floor_id"]: f["name"] for f in floor_reg["data"]["floors"]}
+
+        filtered_entities = []
+        excluded_platforms = []
+
+        # Platform and area IDs repeat across many entities. Interning them here
+        # (after loading, so it covers cache hits too) lets the set/dict checks
+        # below match the interned config/area keys by identity.
+        intern = sys.intern
+
+        # Bind hot-loop callables to locals to skip attribute/global lookups
+        should_include = self._should_include_entity
+        domain_for = HOMEKIT_DOMAINS.get
+        area_name_for = area_map.get
+        device_area_for = device_to_area.get
+        append = filtered_entities.append
+
+        # Mask pass: most registry entries are sensors etc., so pick out enabled
+        # lights/switches in one comprehension before the per-entity work below
+        candidates = [
+            (entity, domain) for entity in entity_reg["data"]["entities"]
+            if entity.get("disabled_by") is None
+            and (domain := domain_for(entity["entity_id"].partition(".")[0])) is not None
+        ]
+
+        for entity, domain in candidates:
+            get = entity.get
+            entity_id = entity["entity_id"]
 
-        for entity in entity_reg["data"]["entities"]:
-            eid = entity["entity_id"]
-            entity_names[eid] = entity.get("name") or entity.get("original_name") or eid.split(".")[1].replace("_", " ").title()
-            entity_platforms[eid] = entity.get("platform", "unknown")
+            # Apply filters
+            platform = get("platform", "unknown")
+            platform = platform and intern(platform)
+            if not should_include(entity_id, platform):
+                excluded_platforms.append(platform)
+                continue
 
-        # Map entities to bridges
-        bridge_entities = defaultdict(lambda: {"lights": [], "switches": []})
-        no_area_entities = {"lights": [], "switches": []}
-        excluded_count = defaultdict(int)
+            # Get area
+            area_id = get("area_id")
+            if not area_id:
+                device_id = get("device_id")
+                if device_id:
+                    area_id = device_area_for(device_id)
+            else:
+                area_id = intern(area_id)
 
-        for entity in entity_reg["data"]["entities"]:
-            # Skip disabled
-            if entity.get("disabled_by") is not None:
-                continue
+            area_name = area_name_for(area_id) if area_id else None
 
-            entity_id = entity["entity_id"]
-            platform = entity.get("platform", "unknown")
+            append((entity_id, domain, area_id, area_name, get("name") or get("original_name")))
 
-            # Only lights and switches
-            if not (entity_id.startswith("light.") or entity_id.startswith("switch.")):
-                continue
+        return RegistryIndices(area_map, device_to_area, area_floors, floor_map,
+                               filtered_entities, Counter(excluded_platforms))
 
-            # Apply filters
-            if not self._should_include_entity(entity_id, platform):
-                excluded_count[platform] += 1
-                continue
+    def generate(self):
+        """Generate entity-to-bridge mapping"""
+        # Banner is printed right away (report body is buffered) so a missing
+        # registry still shows which command failed
+        print("=" * 70)
+        print("Generating HomeKit Bridge Mapping")
+        print("=" * 70)
+        out = []
 
-            # Get area
-            area_id = entity.get("area_id")
-            if not area_id and entity.get("device_id"):
-                area_id = device_to_area.get(entity.get("device_id"))
-
-            area_name = area_map.get(area_id) if area_id else None
-
-            # Assign to bridge
-            domain = "lights" if entity_id.startswith("light.") else "switches"
-            assigned = False
-
-            for bridge in self.config["bridges"]:
-                if area_name in bridge.get("areas", []):
-                    bridge_entities[bridge["name"]][domain].append({
-                        "id": entity_id,
-                        "name": entity_names.get(entity_id, "Unknown")
-                    })
-                    assigned = True
-                    break
-
-            if not assigned:
-                no_area_entities[domain].append({
-                    "id": entity_id,
-                    "name": entity_names.get(entity_id, "Unknown")
-                })
+        indices = self._indices
+        excluded_count = indices.excluded_count
+
+        # Flatten bridge definitions to area -> bridge (first bridge listing an area wins)
+        area_to_bridge = {}
+        for bridge in self.config["bridges"]:
+            for area in bridge.get("areas", []):
+                area_to_bridge.setdefault(area, bridge["name"])
+
+        # Map entities to bridges (IDs only; names go to a separate file)
+        bridge_entities = {b["name"]: {"lights": [], "switches": []} for b in self.config["bridges"]}
+        no_area_entities = {"lights": [], "switches": []}
+        entity_names = {}
 
-        # Sort entities
-        for bridge_name in bridge_entities:
-            bridge_entities[bridge_name]["lights"].sort(key=lambda x: x["id"])
-            bridge_entities[bridge_name]["switches"].sort(key=lambda x: x["id"])
+        for entity_id, domain, _area_id, area_name, name in indices.filtered_entities:
+            bridge_name = area_to_bridge.get(area_name)
+            (bridge_entities[bridge_name] if bridge_name else no_area_entities)[domain].append(entity_id)
+            entity_names[entity_id] = name
 
-        # Save mapping
+        # Save mapping, sorting each bridge's IDs once as the output is built
         mapping = {
-            "bridges": dict(bridge_entities),
+            "bridges": {
+                bridge_name: {domain: sorted(ids) for domain, ids in domains.items()}
+                for bridge_name, domains in bridge_entities.items()
+            },
             "no_area": no_area_entities,
             "generated_at": datetime.now().isoformat()
         }
 
         output_file = self.output_dir / "homekit_mapping.json"
-        with open(output_file, "w") as f:
-            json.dump(mapping, f, indent=2)
+        _write_json(output_file, mapping)
+
+        # Friendly names for reviewing the mapping; apply() never reads these
+        names_file = self.output_dir / "homekit_mapping_names.json"
+        _write_json(names_file, {
+            entity_id: _display_name(entity_id, name) for entity_id, name in sorted(entity_names.items())
+        })
 
         # Print summary
-        print(f"\n✓ Mapping saved: {output_file}")
+        out.append(f"\n✓ Mapping saved: {output_file}")
+        out.append(f"✓ Names saved: {names_file}")
 
         total_included = 0
-        print("\nBridge Summary:")
+        out.append("\nBridge Summary:")
         for bridge in self.config["bridges"]:
             name = bridge["name"]
             if name in bridge_entities:
@@ -220,12 +456,14 @@ class HomeKitBridgeManager:
                 total = lights + switches
                 total_included += total
                 status = "✅" if total <= 150 else "❌ OVER LIMIT"
-                print(f"  {name}: {total} entities ({lights} lights, {switches} switches) {status}")
+                out.append(f"  {name}: {total} entities ({lights} lights, {switches} switches) {status}")
 
         if excluded_count:
-            print(f"\nExcluded {sum(excluded_count.values())} entities by integration")
+            out.append(f"\nExcluded {sum(excluded_count.values())} entities by integration")
+
+        out.append(f"\nUnassigned: {len(no_area_entities['lights']) + len(no_area_entities['switches'])} entities")
 
-        print(f"\nUnassigned: {len(no_area_entities['lights']) + len(no_area_entities['switches'])} entities")
+        sys.stdout.write("\n".join(out) + "\n")
 
         return mapping
 
@@ -242,13 +480,11 @@ class HomeKitBridgeManager:
             print("   Run 'generate' first")
             return False
 
-        with open(mapping_file) as f:
-            mapping = json.load(f)
+        mapping = _read_json(mapping_file)
 
         # Load current config
         config_path = self.storage_path / "core.config_entries"
-        with open(config_path) as f:
-            config = json.load(f)
+        config = _read_json(config_path)
 
         # Find bridge entry IDs by name
         bridge_entries = {}
@@ -270,7 +506,12 @@ class HomeKitBridgeManager:
 
             # Create backup
             backup_path = config_path.parent / f"core.config_entries.backup.{datetime.now().strftime('%Y%m%d_%H%M%S')}"
-            shutil.copy2(config_path, backup_path)
+            # Hardlink is free; the config is later replaced via rename, never
+            # rewritten in place, so the linked inode keeps the old contents
+            try:
+                os.link(config_path, backup_path)
+            except OSError:
+                shutil.copy2(config_path, backup_path)
             print(f"✓ Backup: {backup_path.name}")
 
         # Update each bridge
@@ -285,10 +526,10 @@ class HomeKitBridgeManager:
             entry = bridge_entries[name]
             bridge_data = mapping["bridges"].get(name, {"lights": [], "switches": []})
 
-            # Build include list
+            # Build include list (older mappings stored {"id", "name"} records)
             include_list = sorted(
-                [e["id"] for e in bridge_data["lights"]] +
-                [e["id"] for e in bridge_data["switches"]]
+                e if isinstance(e, str) else e["id"]
+                for e in bridge_data["lights"] + bridge_data["switches"]
             )
 
             # Update filter config
@@ -307,8 +548,7 @@ class HomeKitBridgeManager:
 
         # Save config
         if not dry_run:
-            with open(config_path, "w") as f:
-                json.dump(config, f, indent=2)
+            _write_json(config_path, config)
             print("\n✓ Configuration saved")
 
             # Start HA
@@ -331,161 +571,112 @@ class HomeKitBridgeManager:
         print("=" * 70)
         print("Analyzing Home Assistant for Bridge Planning")
         print("=" * 70)
+        out = []
 
-        # Load registries
-        entity_reg = self._load_registry("entity_registry")
-        device_reg = self._load_registry("device_registry")
-        area_reg = self._load_registry("area_registry")
-        floor_reg_path = self.storage_path / "core.floor_registry"
-
-        # Build lookups
-        area_map = {a["id"]: a["name"] for a in area_reg["data"]["areas"]}
-        area_floors = {a["id"]: a.get("floor_id") for a in area_reg["data"]["areas"]}
-        device_to_area = {d["id"]: d.get("area_id") for d in device_reg["data"]["devices"]}
-
-        # Load floors if available
-        floor_map = {}
-        if floor_reg_path.exists():
-            with open(floor_reg_path) as f:
-                floor_reg = json.load(f)
-                floor_map = {f["floor_id"]: f["name"] for f in floor_reg["data"]["floors"]}
-
-        # Count entities per area
-        area_counts = defaultdict(lambda: {"lights": 0, "switches": 0, "floor": None})
+        indices = self._indices
+        area_map = indices.area_map
+        area_floors = indices.area_floors
+        floor_map = indices.floor_map
 
-        for entity in entity_reg["data"]["entities"]:
-            if entity.get("disabled_by") is not None:
-                continue
-
-            entity_id = entity["entity_id"]
-            platform = entity.get("platform", "unknown")
-
-            if not (entity_id.startswith("light.") or entity_id.startswith("switch.")):
-                continue
-
-            if not self._should_include_entity(entity_id, platform):
-                continue
-
-            # Get area
-            area_id = entity.get("area_id")
-            if not area_id and entity.get("device_id"):
-                area_id = device_to_area.get(entity.get("device_id"))
+        # Count entities per area, grouped by floor name (None = no floor)
+        floors = {}
+        floor_totals = defaultdict(int)
 
+        for _entity_id, domain, area_id, _area_name, _name in indices.filtered_entities:
             if area_id:
                 area_name = area_map.get(area_id, "Unknown")
-                domain = "lights" if entity_id.startswith("light.") else "switches"
-                area_counts[area_name][domain] += 1
-
-                # Track floor
-                floor_id = area_floors.get(area_id)
-                if floor_id and floor_id in floor_map:
-                    area_counts[area_name]["floor"] = floor_map[floor_id]
-
-        # Group by floor
-        floors = defaultdict(list)
-        no_floor = []
-
-        for area_name, counts in sorted(area_counts.items()):
-            total = counts["lights"] + counts["switches"]
-            floor = counts["floor"]
-
-            area_info = {
-                "name": area_name,
-                "lights": counts["lights"],
-                "switches": counts["switches"],
-                "total": total
-            }
-
-            if floor:
-                floors[floor].append(area_info)
-            else:
-                no_floor.append(area_info)
-
-        # Print analysis
-        print("\n" + "=" * 70)
-        print("Entity Counts by Area (after filtering)")
-        print("=" * 70)
-
-        total_entities = 0
-
-        for floor_name in sorted(floors.keys()):
-            areas = floors[floor_name]
-            floor_total = sum(a["total"] for a in areas)
-            total_entities += floor_total
-
-            print(f"\n📍 {floor_name} ({floor_total} entities)")
-            for area in sorted(areas, key=lambda x: -x["total"]):
-                print(f"   {area['name']}: {area['total']} ({area['lights']}L, {area['switches']}S)")
-
-        if no_floor:
-            floor_total = sum(a["total"] for a in no_floor)
-            total_entities += floor_total
-            print(f"\n📍 No Floor Assigned ({floor_total} entities)")
-            for area in sorted(no_floor, key=lambda x: -x["total"]):
-                print(f"   {area['name']}: {area['total']} ({area['lights']}L, {area['switches']}S)")
-
-        # Suggest bridge groupings
-        print("\n" + "=" * 70)
-        print("Suggested Bridge Configuration")
-        print("=" * 70)
-
-        bridges_needed = (total_entities // 150) + (1 if total_entities % 150 else 0)
-        print(f"\nTotal entities: {total_entities}")
-        print(f"Minimum bridges needed: {bridges_needed} (to stay under 150 each)")
-
-        # Simple suggestion: group by floor
-        print("\n📋 Suggested bridges (by floor):\n")
+                floor_name = floor_map.get(area_floors.get(area_id)) or None
+
+                areas = floors.get(floor_name)
+                if areas is None:
+                    areas = floors[floor_name] = {}
+                area = areas.get(area_name)
+                if area is None:
+                    area = areas[area_name] = {"name": area_name, "lights": 0, "switches": 0, "total": 0}
+                area[domain] += 1
+                area["total"] += 1
+                floor_totals[floor_name] += 1
+
+        total_entities = sum(floor_totals.values())
+        floor_names = sorted(name for name in floors if name is not None)
+        if None in floors:
+            floor_names.append(None)
+
+        # Print counts and build suggestions in one pass over the floors
+        out.append("\n" + "=" * 70)
+        out.append("Entity Counts by Area (after filtering)")
+        out.append("=" * 70)
 
         suggested_bridges = []
-        for floor_name in sorted(floors.keys()):
+        for floor_name in floor_names:
             areas = floors[floor_name]
-            floor_total = sum(a["total"] for a in areas)
+            floor_total = floor_totals[floor_name]
+            by_size = sorted(areas.values(), key=lambda x: (-x["total"], x["name"]))
+
+            out.append(f"\n📍 {floor_name or 'No Floor Assigned'} ({floor_total} entities)")
+            for area in by_size:
+                out.append(f"   {area['name']}: {area['total']} ({area['lights']}L, {area['switches']}S)")
 
+            # Simple suggestion: group by floor
+            if floor_name is None:
+                continue
             if floor_total <= 150:
                 # Single bridge for this floor
                 suggested_bridges.append({
                     "name": floor_name,
-                    "areas": [a["name"] for a in areas],
+                    "areas": sorted(areas),
                     "count": floor_total
                 })
             else:
-                # Need to split this floor
-                current_bridge = {"name": f"{floor_name} A", "areas": [], "count": 0}
-                bridge_num = 1
+                # Need to split this floor: first-fit decreasing, so a smaller
+                # area can still fill a gap left in an earlier bridge
+                floor_bridges = []
+
+                for area in by_size:
+                    for bridge in floor_bridges:
+                        if bridge["count"] + area["total"] <= 150:
+                            break
+                    else:
+                        suffix = chr(ord('A') + len(floor_bridges))
+                        bridge = {"name": f"{floor_name} {suffix}", "areas": [], "count": 0}
+                        floor_bridges.append(bridge)
+
+                    bridge["areas"].append(area["name"])
+                    bridge["count"] += area["total"]
 
-                for area in sorted(areas, key=lambda x: -x["total"]):
-                    if current_bridge["count"] + area["total"] > 150:
-                        # Save current and start new
-                        if current_bridge["areas"]:
-                            suggested_bridges.append(current_bridge)
-                        bridge_num += 1
-                        suffix = chr(ord('A') + bridge_num - 1)
-                        current_bridge = {"name": f"{floor_name} {suffix}", "areas": [], "count": 0}
+                suggested_bridges.extend(floor_bridges)
 
-                    current_bridge["areas"].append(area["name"])
-                    current_bridge["count"] += area["total"]
+        # Suggest bridge groupings
+        out.append("\n" + "=" * 70)
+        out.append("Suggested Bridge Configuration")
+        out.append("=" * 70)
+
+        bridges_needed = (total_entities // 150) + (1 if total_entities % 150 else 0)
+        out.append(f"\nTotal entities: {total_entities}")
+        out.append(f"Minimum bridges needed: {bridges_needed} (to stay under 150 each)")
 
-                if current_bridge["areas"]:
-                    suggested_bridges.append(current_bridge)
+        out.append("\n📋 Suggested bridges (by floor):\n")
 
         # Print suggestions
         for bridge in suggested_bridges:
             status = "✅" if bridge["count"] <= 150 else "❌"
-            print(f"{status} {bridge['name']}: {bridge['count']} entities")
-            print(f"   Areas: {', '.join(bridge['areas'])}")
-            print()
+            out.append(f"{status} {bridge['name']}: {bridge['count']} entities")
+            out.append(f"   Areas: {', '.join(bridge['areas'])}")
+            out.append("")
 
         # Generate config snippet
-        print("=" * 70)
-        print("Config.yaml snippet:")
-        print("=" * 70)
-        print("\nbridges:")
+        out.append("=" * 70)
+        out.append("Config.yaml snippet:")
+        out.append("=" * 70)
+        out.append("\nbridges:")
         for bridge in suggested_bridges:
-            print(f"  - name: {bridge['name']}")
-            print(f"    areas:")
+            out.append(f"  - name: {bridge['name']}")
+            out.append(f"    areas:")
             for area in bridge["areas"]:
-                print(f"      - {area}")
-            print()
+                out.append(f"      - {area}")
+            out.append("")
+
+        sys.stdout.write("\n".join(out) + "\n")
 
         return suggested_bridges
 
@@ -494,10 +685,11 @@ class HomeKitBridgeManager:
         print("=" * 70)
         print("Validating HomeKit Bridge Configuration")
         print("=" * 70)
+        out = []
 
         config = self._load_registry("config_entries")
 
-        print("\nCurrent Bridges:")
+        out.append("\nCurrent Bridges:")
         for entry in config["data"]["entries"]:
             if entry.get("domain") != "homekit":
                 continue
@@ -520,17 +712,20 @@ class HomeKitBridgeManager:
                 count = "?"
 
             status = "✅" if (isinstance(count, int) and count <= 150) else ""
-            print(f"  {name}: {count} entities ({mode} mode) {status}")
+            out.append(f"  {name}: {count} entities ({mode} mode) {status}")
+
+        sys.stdout.write("\n".join(out) + "\n")
 
     def list_bridges(self):
         """List available bridges and their entry IDs"""
         print("=" * 70)
         print("HomeKit Bridges in Home Assistant")
         print("=" * 70)
+        out = []
 
         config = self._load_registry("config_entries")
 
-        print("\nBridges:")
+        out.append("\nBridges:")
         for entry in config["data"]["entries"]:
             if entry.get("domain") != "homekit":
                 continue
@@ -539,10 +734,12 @@ class HomeKitBridgeManager:
             entry_id = entry.get("entry_id", "Unknown")
             port = entry.get("data", {}).get("port", "?")
 
-            print(f"  {name}")
-            print(f"    Entry ID: {entry_id}")
-            print(f"    Port: {port}")
-            print()
+            out.append(f"  {name}")
+            out.append(f"    Entry ID: {entry_id}")
+            out.append(f"    Port: {port}")
+            out.append("")
+
+        sys.stdout.write("\n".join(out) + "\n")
 
 
 def main():